@@ -4,11 +4,22 @@ Usage: python basic_example.py <adapter>
 
 This example expects a physical slave layout according to
 _expected_slave_layout, see below.
+
+On Linux the process data thread is pinned to a CPU core and scheduled
+with SCHED_FIFO, and the process memory is locked. Both need root or an
+appropriate limit for the user, for example "* hard rtprio 99" in
+/etc/security/limits.conf. If this fails the example keeps running with
+the default scheduling.
 """
 
+import os
 import sys
+import queue
+import ctypes
 import struct
 import time
+import logging
+import logging.handlers
 import threading
 
 from collections import namedtuple
@@ -16,6 +27,57 @@ from collections import namedtuple
 import pysoem
 
 
+# The worker threads only put records into a queue, the actual formatting and
+# writing to the terminal is done by a QueueListener thread, see __main__ below.
+logger = logging.getLogger('basic_example')
+
+
+_RX_MAP_OBJ = (0x1603,
+               0x1607,
+               0x160B,
+               0x160F,
+               0x1611,
+               0x1617,
+               0x161B,
+               0x161F,
+               0x1620,
+               0x1621,
+               0x1622,
+               0x1623,
+               0x1624,
+               0x1625,
+               0x1626,
+               0x1627)
+# the mapping is constant, so pack it once at import instead of on every PreOP->SafeOP transition
+_RX_MAP_BYTES = struct.pack('<BxHHHHHHHHHHHHHHHH', len(_RX_MAP_OBJ), *_RX_MAP_OBJ)
+
+
+def _lock_memory():
+    """Lock all current and future pages in RAM to avoid page faults in the cyclic threads."""
+    if sys.platform != 'linux':
+        return
+    mcl_current = 1
+    mcl_future = 2
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.mlockall(mcl_current | mcl_future) != 0:
+        logger.warning('mlockall failed: %s', os.strerror(ctypes.get_errno()))
+
+
+def _make_rt(thread, core=3, prio=80):
+    """Pin a started thread to a single core and switch it to SCHED_FIFO."""
+    if sys.platform != 'linux':
+        return
+    # independent of each other, a missing core must not prevent SCHED_FIFO
+    try:
+        os.sched_setaffinity(thread.native_id, {core})
+    except OSError as ex:
+        logger.warning('could not pin thread %s to core %d: %s', thread.name, core, ex)
+    try:
+        os.sched_setscheduler(thread.native_id, os.SCHED_FIFO, os.sched_param(prio))
+    except OSError as ex:
+        logger.warning('could not switch thread %s to SCHED_FIFO: %s', thread.name, ex)
+
+
 class BasicExample:
 
     BECKHOFF_VENDOR_ID = 0x0002
@@ -23,11 +85,14 @@ class BasicExample:
     EL3002_PRODUCT_CODE = 0x0bba3052
     EL1259_PRODUCT_CODE = 0x04eb3052
 
+    PD_CYCLE_TIME = 0.01  # seconds, matches the SYNC0 cycle time set in el1259_setup
+
     def __init__(self, ifname):
         self._ifname = ifname
         self._pd_thread_stop_event = threading.Event()
         self._ch_thread_stop_event = threading.Event()
         self._actual_wkc = 0
+        self._expected_wkc = 0
         self._master = pysoem.Master()
         self._master.in_op = False
         self._master.do_check_state = False
@@ -41,52 +106,47 @@ class BasicExample:
 
         slave.sdo_write(0x8001, 2, struct.pack('B', 1))
 
-        rx_map_obj = [0x1603,
-                      0x1607,
-                      0x160B,
-                      0x160F,
-                      0x1611,
-                      0x1617,
-                      0x161B,
-                      0x161F,
-                      0x1620,
-                      0x1621,
-                      0x1622,
-                      0x1623,
-                      0x1624,
-                      0x1625,
-                      0x1626,
-                      0x1627]
-        rx_map_obj_bytes = struct.pack(
-            'Bx' + ''.join(['H' for i in range(len(rx_map_obj))]), len(rx_map_obj), *rx_map_obj)
-        slave.sdo_write(0x1c12, 0, rx_map_obj_bytes, True)
+        slave.sdo_write(0x1c12, 0, _RX_MAP_BYTES, True)
 
         slave.dc_sync(1, 10000000)
 
     def _processdata_thread(self):
-        while not self._pd_thread_stop_event.is_set():
-            self._master.send_processdata()
-            self._actual_wkc = self._master.receive_processdata(10000)
-            if not self._actual_wkc == self._master.expected_wkc:
-                print('incorrect wkc')
-            time.sleep(0.01)
+        # Sleep towards an absolute deadline that is advanced by the cycle time, so that the time
+        # spent in send/receive does not accumulate to a drift like with a plain relative sleep.
+        master = self._master
+        send_processdata = master.send_processdata
+        receive_processdata = master.receive_processdata
+        stop_event_wait = self._pd_thread_stop_event.wait
+        monotonic = time.monotonic
+        cycle_time = self.PD_CYCLE_TIME
+        expected_wkc = self._expected_wkc
+
+        deadline = monotonic()
+        while True:
+            deadline += cycle_time
+            send_processdata()
+            self._actual_wkc = receive_processdata(10000)
+            if not self._actual_wkc == expected_wkc:
+                logger.warning('incorrect wkc')
+            now = monotonic()
+            if deadline <= now:
+                # overrun, restart the cycle grid instead of trying to catch up
+                deadline = now
+            # wait() returns early with True as soon as the thread is asked to stop
+            if stop_event_wait(deadline - now):
+                break
 
     def _pdo_update_loop(self):
 
         self._master.in_op = True
 
-        output_len = len(self._master.slaves[2].output)
-
-        tmp = bytearray([0 for i in range(output_len)])
+        # the view writes straight into the IO map, no bytes object is built and copied per toggle
+        output = self._master.slaves[2].output_view()
 
         toggle = True
         try:
             while 1:
-                if toggle:
-                    tmp[0] = 0x00
-                else:
-                    tmp[0] = 0x02
-                self._master.slaves[2].output = bytes(tmp)
+                output[0] = 0x00 if toggle else 0x02
 
                 toggle ^= True
 
@@ -99,6 +159,8 @@ class BasicExample:
 
     def run(self):
 
+        _lock_memory()
+
         self._master.open(self._ifname)
 
         if not self._master.config_init() > 0:
@@ -114,6 +176,8 @@ class BasicExample:
             slave.is_lost = False
 
         self._master.config_map()
+        # the expected working counter only depends on the mapping, it is fixed from now on
+        self._expected_wkc = self._master.expected_wkc
 
         if self._master.state_check(pysoem.SAFEOP_STATE, 50000) != pysoem.SAFEOP_STATE:
             self._master.close()
@@ -125,15 +189,13 @@ class BasicExample:
         check_thread.start()
         proc_thread = threading.Thread(target=self._processdata_thread)
         proc_thread.start()
+        _make_rt(proc_thread)
 
         self._master.write_state()
 
-        all_slaves_reached_op_state = False
-        for i in range(40):
-            self._master.state_check(pysoem.OP_STATE, 50000)
-            if self._master.state == pysoem.OP_STATE:
-                all_slaves_reached_op_state = True
-                break
+        # state_check polls internally until the state is reached or the timeout (2 s) expires
+        self._master.state_check(pysoem.OP_STATE, 2000000)
+        all_slaves_reached_op_state = self._master.state == pysoem.OP_STATE
 
         if all_slaves_reached_op_state:
             self._pdo_update_loop()
@@ -153,47 +215,53 @@ class BasicExample:
     @staticmethod
     def _check_slave(slave, pos):
         if slave.state == (pysoem.SAFEOP_STATE + pysoem.STATE_ERROR):
-            print(
-                'ERROR : slave {} is in SAFE_OP + ERROR, attempting ack.'.format(pos))
+            logger.error('slave %d is in SAFE_OP + ERROR, attempting ack.', pos)
             slave.state = pysoem.SAFEOP_STATE + pysoem.STATE_ACK
             slave.write_state()
         elif slave.state == pysoem.SAFEOP_STATE:
-            print(
-                'WARNING : slave {} is in SAFE_OP, try change to OPERATIONAL.'.format(pos))
+            logger.warning('slave %d is in SAFE_OP, try change to OPERATIONAL.', pos)
             slave.state = pysoem.OP_STATE
             slave.write_state()
         elif slave.state > pysoem.NONE_STATE:
             if slave.reconfig():
                 slave.is_lost = False
-                print('MESSAGE : slave {} reconfigured'.format(pos))
+                logger.info('slave %d reconfigured', pos)
         elif not slave.is_lost:
             slave.state_check(pysoem.OP_STATE)
             if slave.state == pysoem.NONE_STATE:
                 slave.is_lost = True
-                print('ERROR : slave {} lost'.format(pos))
+                logger.error('slave %d lost', pos)
         if slave.is_lost:
             if slave.state == pysoem.NONE_STATE:
                 if slave.recover():
                     slave.is_lost = False
-                    print(
-                        'MESSAGE : slave {} recovered'.format(pos))
+                    logger.info('slave %d recovered', pos)
             else:
                 slave.is_lost = False
-                print('MESSAGE : slave {} found'.format(pos))
+                logger.info('slave %d found', pos)
     
     def _check_thread(self):
 
-        while not self._ch_thread_stop_event.is_set():
-            if self._master.in_op and ((self._actual_wkc < self._master.expected_wkc) or self._master.do_check_state):
-                self._master.do_check_state = False
-                self._master.read_state()
-                for i, slave in enumerate(self._master.slaves):
+        master = self._master
+        slaves = master.slaves
+        expected_wkc = self._expected_wkc
+        stop_event_wait = self._ch_thread_stop_event.wait
+
+        while not stop_event_wait(0.01):
+            # snapshot the values shared with the other threads once per iteration
+            in_op = master.in_op
+            actual_wkc = self._actual_wkc
+            do_check_state = master.do_check_state
+            if in_op and ((actual_wkc < expected_wkc) or do_check_state):
+                do_check_state = False
+                master.read_state()
+                for i, slave in enumerate(slaves):
                     if slave.state != pysoem.OP_STATE:
-                        self._master.do_check_state = True
+                        do_check_state = True
                         BasicExample._check_slave(slave, i)
-                if not self._master.do_check_state:
-                    print('OK : all slaves resumed OPERATIONAL.')
-            time.sleep(0.01)
+                master.do_check_state = do_check_state
+                if not do_check_state:
+                    logger.info('all slaves resumed OPERATIONAL.')
 
 
 class BasicExampleError(Exception):
@@ -206,12 +274,22 @@ if __name__ == '__main__':
 
     print('basic_example started')
 
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter('%(levelname)s : %(message)s'))
+    log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+    log_listener.start()
+
     if len(sys.argv) > 1:
         try:
             BasicExample(sys.argv[1]).run()
         except BasicExampleError as expt:
             print('basic_example failed: ' + expt.message)
             sys.exit(1)
+        finally:
+            log_listener.stop()
     else:
         print('usage: basic_example ifname')
         sys.exit(1)
@@ -1,11 +1,11 @@
 """Prints name and description of available network adapters."""
 
+import sys
+
 import pysoem
 
 
 adapters = pysoem.find_adapters()
 
-for i, adapter in enumerate(adapters):
-    print('Adapter {}'.format(i))
-    print('  {}'.format(adapter.name))
-    print('  {}'.format(adapter.desc))
+lines = ['Adapter {}\n  {}\n  {}\n'.format(i, adapter.name, adapter.desc) for i, adapter in enumerate(adapters)]
+sys.stdout.write(''.join(lines))
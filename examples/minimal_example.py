@@ -6,6 +6,7 @@ This example expects a physical slave layout according to
 _expected_slave_layout, see below.
 """
 
+import os
 import sys
 import struct
 import time
@@ -14,27 +15,42 @@ import collections
 import pysoem
 
 
+# both EL3002 channels as little endian int16
+_UNPACK_HH = struct.Struct('<hh').unpack_from
+# +/-10 V full scale of the EL3002
+_SCALE = 10.0 / 0x8000
+
+SlaveSet = collections.namedtuple('SlaveSet', 'slave_name product_code config_func')
+
+
 class MinimalExample:
 
     BECKHOFF_VENDOR_ID = 0x0002
     EK1100_PRODUCT_CODE = 0x044c2c52
     EL3002_PRODUCT_CODE = 0x0bba3052
 
+    # constant PDO assign data for the EL3002, packed once
+    _MAP_1C12 = bytes(1)
+    _MAP_1C13 = struct.pack('BxHH', 2, 0x1A01, 0x1A03)
+
+    CYCLE_NS = 1000000  # 1 kHz process data cycle
+    PRINT_EVERY_N_CYCLES = 1000
+    # Linux only, requires root or an rtprio limit for the user
+    USE_SCHED_FIFO = False
+
     def __init__(self, ifname):
         self._ifname = ifname
         self._master = pysoem.Master()
-        SlaveSet = collections.namedtuple(
-            'SlaveSet', 'slave_name product_code config_func')
-        self._expected_slave_mapping = {0: SlaveSet('EK1100', self.EK1100_PRODUCT_CODE, None),
-                                        1: SlaveSet('EL3002', self.EL3002_PRODUCT_CODE, self.el3002_setup)}
+        # indexed by slave position
+        self._expected_slave_layout = [SlaveSet('EK1100', self.EK1100_PRODUCT_CODE, None),
+                                       SlaveSet('EL3002', self.EL3002_PRODUCT_CODE, self.el3002_setup)]
 
     def el3002_setup(self, slave_pos):
         slave = self._master.slaves[slave_pos]
 
-        slave.sdo_write(0x1c12, 0, struct.pack('B', 0))
+        slave.sdo_write(0x1c12, 0, self._MAP_1C12)
 
-        map_1c13_bytes = struct.pack('BxHH', 2, 0x1A01, 0x1A03)
-        slave.sdo_write(0x1c13, 0, map_1c13_bytes, True)
+        slave.sdo_write(0x1c13, 0, self._MAP_1C13, True)
 
     def run(self):
 
@@ -47,10 +63,10 @@ class MinimalExample:
                 len(self._master.slaves)))
 
             for i, slave in enumerate(self._master.slaves):
+                expected = self._expected_slave_layout[i]
                 assert(slave.man == self.BECKHOFF_VENDOR_ID)
-                assert(
-                    slave.id == self._expected_slave_mapping[i].product_code)
-                slave.config_func = self._expected_slave_mapping[i].config_func
+                assert(slave.id == expected.product_code)
+                slave.config_func = expected.config_func
 
             # PREOP_STATE to SAFEOP_STATE request - each slave's config_func is called
             self._master.config_map()
@@ -65,6 +81,10 @@ class MinimalExample:
                                                               pysoem.al_status_code_to_string(slave.al_status)))
                 raise Exception('not all slaves reached SAFEOP state')
 
+            # a view on the EL3002 inputs within the IO map, it is updated in place by receive_processdata
+            # (for slaves with outputs, output_view() is the counterpart, fill it with e.g. struct.pack_into)
+            el3002_input = self._master.slaves[1].input_view()
+
             self._master.state = pysoem.OP_STATE
             self._master.write_state()
 
@@ -78,20 +98,33 @@ class MinimalExample:
                                                               pysoem.al_status_code_to_string(slave.al_status)))
                 raise Exception('not all slaves reached OP state')
 
+            if self.USE_SCHED_FIFO and sys.platform == 'linux':
+                try:
+                    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(80))
+                except OSError as ex:
+                    print('could not switch to SCHED_FIFO: {}'.format(ex))
+
             try:
+                cycle_count = 0
+                next_deadline = time.monotonic_ns() + self.CYCLE_NS
                 while 1:
-                    # free run cycle
-                    self._master.send_processdata()
-                    self._master.receive_processdata(2000)
-
-                    volgage_ch_1_el3002_as_bytes = self._master.slaves[1].input
-                    volgage_ch_1_el3002_as_int16 = struct.unpack(
-                        'hh', volgage_ch_1_el3002_as_bytes)[0]
-                    voltage = volgage_ch_1_el3002_as_int16 * 10 / 0x8000
-                    print('EL3002 Ch 1 PDO: {:#06x}; Voltage: {:.4}'.format(
-                        volgage_ch_1_el3002_as_int16, voltage))
-
-                    time.sleep(1)
+                    # cycle on a fixed grid, so the slaves process image is kept up to date
+                    self._master.cycle(2000)
+
+                    if cycle_count % self.PRINT_EVERY_N_CYCLES == 0:
+                        volgage_ch_1_el3002_as_int16, _ = _UNPACK_HH(el3002_input)
+                        voltage = volgage_ch_1_el3002_as_int16 * _SCALE
+                        print('EL3002 Ch 1 PDO: {:#06x}; Voltage: {:.4}'.format(
+                            volgage_ch_1_el3002_as_int16, voltage))
+                    cycle_count += 1
+
+                    now = time.monotonic_ns()
+                    if next_deadline <= now:
+                        # overrun, restart the grid instead of running a burst of catch-up cycles
+                        next_deadline = now
+                    else:
+                        time.sleep((next_deadline - now) / 1e9)
+                    next_deadline += self.CYCLE_NS
 
             except KeyboardInterrupt:
                 # ctrl-C abort handling
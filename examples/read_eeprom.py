@@ -12,10 +12,12 @@ def read_eeprom_of_first_slave(ifname):
     if master.config_init() > 0:
     
         first_slave = master.slaves[0]
-        
+
+        # read the first 0x80 words in one go
+        eeprom_data = first_slave.eeprom_read_bulk(0, 0x80)
+
         for i in range(0, 0x80, 2):
-            print('{:04x}:'.format(i), end='')
-            print('|'.join('{:02x}'.format(x) for x in first_slave.eeprom_read(i)))
+            print('{:04x}:{}'.format(i, eeprom_data[2*i:2*i+4].hex('|')))
     
     else:
         print('no slave available')
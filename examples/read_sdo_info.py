@@ -17,10 +17,11 @@ def read_sdo_info(ifname):
             except pysoem.SdoInfoError:
                 print('no SDO info for {}'.format(slave.name))
             else:
-                print(slave.name)
+                # collect the lines of a slave and write them at once
+                lines = [slave.name]
 
                 for obj in od:
-                    print(' Idx: {}; Code: {}; Type: {}; BitSize: {}; Access: {}; Name: "{}"'.format(
+                    lines.append(' Idx: {}; Code: {}; Type: {}; BitSize: {}; Access: {}; Name: "{}"'.format(
                         hex(obj.index),
                         obj.object_code,
                         obj.data_type,
@@ -29,13 +30,15 @@ def read_sdo_info(ifname):
                         obj.name))
                     for i, entry in enumerate(obj.entries):
                         if entry.data_type > 0 and entry.bit_length > 0:
-                            print('  Subindex {}; Type: {}; BitSize: {}; Access: {} Name: "{}"'.format(
+                            lines.append('  Subindex {}; Type: {}; BitSize: {}; Access: {} Name: "{}"'.format(
                                 i,
                                 entry.data_type,
                                 entry.bit_length,
                                 hex(entry.obj_access),
                                 entry.name))
 
+                sys.stdout.write('\n'.join(lines) + '\n')
+
     else:
         print('no slave available')
         
@@ -1,5 +1,7 @@
 
+import os
 import sys
+import mmap
 
 import pysoem
 
@@ -14,9 +16,14 @@ def write_file_to_first_slave(ifname, file_path):
 
             first_slave = master.slaves[0]
 
+            # map the file instead of reading it, foe_write reads straight from the mapped pages
             with open(file_path, 'rb') as file:
-                file_data = file.read()
-                first_slave.foe_write('data.bin', 0, file_data)
+                if os.fstat(file.fileno()).st_size == 0:
+                    # an empty file can't be mapped
+                    first_slave.foe_write('data.bin', 0, b'', release_gil=True)
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_data:
+                        first_slave.foe_write('data.bin', 0, file_data, release_gil=True)
         else:
             print('no slave available')
     except Exception as ex:
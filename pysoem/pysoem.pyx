@@ -11,7 +11,7 @@
 #
 """PySOEM is a Cython wrapper for the SOEM library."""
 
-cimport cpysoem
+from pysoem cimport cpysoem
 
 import sys
 import logging
@@ -20,6 +20,8 @@ import time
 
 from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
 from cpython.bytes cimport PyBytes_FromString, PyBytes_FromStringAndSize
+from cpython.memoryview cimport PyMemoryView_FromMemory
+from cpython.buffer cimport PyBUF_READ, PyBUF_WRITE
 from libc.stdint cimport int8_t, int16_t, int32_t, int64_t, uint8_t, uint16_t, uint32_t, uint64_t
 from libc.string cimport memcpy
 
@@ -66,6 +68,22 @@ cdef struct CdefMasterSettings:
     int* sdo_read_timeout
     int* sdo_write_timeout
 
+cdef class _Settings:
+    """Global settings of pysoem, use the instance pysoem.settings.
+
+    Attributes:
+        always_release_gil (bool): release the GIL in blocking functions like state_check(), read_state(),
+            sdo_read(), sdo_write() and foe_write(), unless the release_gil argument of a call says otherwise.
+            Defaults to False.
+    """
+    cdef public bint always_release_gil
+
+    def __init__(self):
+        self.always_release_gil = False
+
+
+settings = _Settings()
+
 def find_adapters():
     """Create a list of available network adapters.
     
@@ -81,6 +99,9 @@ def find_adapters():
         _ec_adapter = _ec_adapter.next
     return adapters
     
+# AL status code -> text, filled on first lookup of each code
+_al_status_strings = {}
+
 def al_status_code_to_string(code):
     """Look up text string that belongs to AL status code.
     
@@ -91,7 +112,12 @@ def al_status_code_to_string(code):
         str: A verbal description of status code
     
     """
-    return cpysoem.ec_ALstatuscode2string(code).decode('utf8');
+    try:
+        return _al_status_strings[code]
+    except KeyError:
+        text = cpysoem.ec_ALstatuscode2string(code).decode('utf8')
+        _al_status_strings[code] = text
+        return text
     
     
 class Master(CdefMaster):
@@ -217,7 +243,7 @@ cdef class CdefMaster:
         for slave in self.slaves:
             cd = slave._cd
             if cd.exc_raised:
-                raise cd.exc_info[0],cd.exc_info[1],cd.exc_info[2]
+                raise cd.exc_info[1].with_traceback(cd.exc_info[2])
         logging.debug('io map size: {}'.format(ret_val))
         # sanity check
         assert(ret_val<=EC_IOMAPSIZE)
@@ -240,7 +266,7 @@ cdef class CdefMaster:
         for slave in self.slaves:
             cd = slave._cd
             if cd.exc_raised:
-                raise cd.exc_info[0],cd.exc_info[1],cd.exc_info[2]
+                raise cd.exc_info[1].with_traceback(cd.exc_info[2])
         logging.debug('io map size: {}'.format(ret_val))
         # sanity check
         assert(ret_val<=EC_IOMAPSIZE)
@@ -293,7 +319,13 @@ cdef class CdefMaster:
         Returns:
             int: lowest state found
         """
-        return cpysoem.ecx_readstate(&self._ecx_contextt)
+        cdef int result
+        if settings.always_release_gil:
+            with nogil:
+                result = cpysoem.ecx_readstate(&self._ecx_contextt)
+        else:
+            result = cpysoem.ecx_readstate(&self._ecx_contextt)
+        return result
         
     def write_state(self):
         """Write all slaves state.
@@ -305,7 +337,7 @@ cdef class CdefMaster:
         """
         return cpysoem.ecx_writestate(&self._ecx_contextt, 0)
         
-    def state_check(self, int expected_state, timeout=50000):
+    def state_check(self, int expected_state, int timeout=50000):
         """Check actual slave state.
         
         This is a blocking function.
@@ -318,7 +350,13 @@ cdef class CdefMaster:
         Returns:
             int: Requested state, or found state after timeout
         """
-        return cpysoem.ecx_statecheck(&self._ecx_contextt, 0, expected_state, timeout)
+        cdef uint16_t result
+        if settings.always_release_gil:
+            with nogil:
+                result = cpysoem.ecx_statecheck(&self._ecx_contextt, 0, expected_state, timeout)
+        else:
+            result = cpysoem.ecx_statecheck(&self._ecx_contextt, 0, expected_state, timeout)
+        return result
         
     def send_processdata(self):
         """Transmit processdata to slaves.
@@ -357,6 +395,39 @@ cdef class CdefMaster:
             int: Working Counter
         """
         return cpysoem.ecx_receive_processdata(&self._ecx_contextt, timeout)
+
+    def cycle(self, int timeout=2000):
+        """Transmit and receive processdata in one call.
+
+        Same as send_processdata() followed by receive_processdata(), but the GIL is released only once for both,
+        and there is no interpreter work between transmitting and receiving the frames.
+
+        Args:
+            timeout (int): Timeout in us for receiving the processdata.
+        Returns:
+            int: Working Counter
+        """
+        cdef int wkc
+        with nogil:
+            cpysoem.ecx_send_processdata(&self._ecx_contextt)
+            wkc = cpysoem.ecx_receive_processdata(&self._ecx_contextt, timeout)
+        return wkc
+
+    def overlap_cycle(self, int timeout=2000):
+        """Transmit and receive overlap processdata in one call.
+
+        Same as cycle(), but for a master configured with config_overlap_map().
+
+        Args:
+            timeout (int): Timeout in us for receiving the processdata.
+        Returns:
+            int: Working Counter
+        """
+        cdef int wkc
+        with nogil:
+            cpysoem.ecx_send_overlap_processdata(&self._ecx_contextt)
+            wkc = cpysoem.ecx_receive_processdata(&self._ecx_contextt, timeout)
+        return wkc
         
     def _get_slave(self, int pos):
         if pos < 0:
@@ -394,6 +465,19 @@ cdef class CdefMaster:
         return self._ec_DCtime
         
     dc_time = property(_get_dc_time)
+
+    def _get_slave_states(self):
+        """The states of all slaves as bytes, one byte per slave in the order of the slaves list.
+
+        The states are not read from the slaves, call read_state() before to refresh them."""
+        cdef int i
+        cdef bytes states = PyBytes_FromStringAndSize(NULL, self._ec_slavecount)
+        cdef char* pstates = states
+        for i in range(self._ec_slavecount):
+            pstates[i] = <char>self._ec_slave[i+1].state  # +1 as _ec_slave[0] is reserved
+        return states
+
+    slave_states = property(_get_slave_states)
         
         
 class SdoError(Exception):
@@ -533,7 +617,7 @@ cdef class CdefSlave:
         else:
             cpysoem.ecx_dcsync01(self._ecx_contextt, self._pos, act, sync0_cycle_time, sync1_cycle_time, sync0_shift_time) 
 
-    def sdo_read(self, index, uint8_t subindex, int size=0, ca=False):
+    def sdo_read(self, uint16_t index, uint8_t subindex, int size=0, cpysoem.boolean ca=False, release_gil=None):
         """Read a CoE object.
 
         When leaving out the size parameter, objects up to 256 bytes can be read.
@@ -544,6 +628,8 @@ cdef class CdefSlave:
             subindex (int): Subindex of the object.
             size (:obj:`int`, optioinal): The size of the reading buffer.
             ca (:obj:`bool`, optional): complete access
+            release_gil (:obj:`bool`, optional): release the GIL while waiting for the mailbox response,
+                so that other Python threads can run in the meantime, defaults to settings.always_release_gil
 
         Returns:
             bytes: The content of the sdo object.
@@ -569,8 +655,17 @@ cdef class CdefSlave:
         if pbuf == NULL:
             raise MemoryError()
         
-        cdef int result = cpysoem.ecx_SDOread(self._ecx_contextt, self._pos, index, subindex, ca,
-                                              &size_inout, pbuf, self._the_masters_settings.sdo_read_timeout[0])
+        cdef cpysoem.ecx_contextt* ecx_contextt = self._ecx_contextt
+        cdef uint16_t pos = self._pos
+        cdef int timeout = self._the_masters_settings.sdo_read_timeout[0]
+        cdef int result
+        if release_gil is None:
+            release_gil = settings.always_release_gil
+        if release_gil:
+            with nogil:
+                result = cpysoem.ecx_SDOread(ecx_contextt, pos, index, subindex, ca, &size_inout, pbuf, timeout)
+        else:
+            result = cpysoem.ecx_SDOread(ecx_contextt, pos, index, subindex, ca, &size_inout, pbuf, timeout)
 
         cdef cpysoem.ec_errort err
         if cpysoem.ecx_poperror(self._ecx_contextt, &err):
@@ -585,7 +680,7 @@ cdef class CdefSlave:
             if pbuf != std_buffer:
                 PyMem_Free(pbuf)
             
-    def sdo_write(self, index, uint8_t subindex, bytes data, ca=False):
+    def sdo_write(self, uint16_t index, uint8_t subindex, bytes data, cpysoem.boolean ca=False, release_gil=None):
         """Write to a CoE object.
         
         Args:
@@ -593,6 +688,8 @@ cdef class CdefSlave:
             subindex (int): Subindex of the object.
             data (bytes): data to be written to the object
             ca (:obj:`bool`, optional): complete access
+            release_gil (:obj:`bool`, optional): release the GIL while waiting for the mailbox response,
+                so that other Python threads can run in the meantime, defaults to settings.always_release_gil
 
         Raises:
             SdoError: if write fails, the exception includes the SDO abort code  
@@ -600,8 +697,18 @@ cdef class CdefSlave:
             PacketError: on packet level error
         """          
         cdef int size = len(data)
-        cdef int result = cpysoem.ecx_SDOwrite(self._ecx_contextt, self._pos, index, subindex, ca,
-                                               size, <unsigned char*>data, self._the_masters_settings.sdo_write_timeout[0])
+        cdef unsigned char* pdata = <unsigned char*>data
+        cdef cpysoem.ecx_contextt* ecx_contextt = self._ecx_contextt
+        cdef uint16_t pos = self._pos
+        cdef int timeout = self._the_masters_settings.sdo_write_timeout[0]
+        cdef int result
+        if release_gil is None:
+            release_gil = settings.always_release_gil
+        if release_gil:
+            with nogil:
+                result = cpysoem.ecx_SDOwrite(ecx_contextt, pos, index, subindex, ca, size, pdata, timeout)
+        else:
+            result = cpysoem.ecx_SDOwrite(ecx_contextt, pos, index, subindex, ca, size, pdata, timeout)
         
         cdef cpysoem.ec_errort err
         if cpysoem.ecx_poperror(self._ecx_contextt, &err):
@@ -614,8 +721,16 @@ cdef class CdefSlave:
         """
         return cpysoem.ecx_writestate(self._ecx_contextt, self._pos)
         
-    def state_check(self, int expected_state, timeout=2000):
-        return cpysoem.ecx_statecheck(self._ecx_contextt, self._pos, expected_state, timeout)
+    def state_check(self, int expected_state, int timeout=2000):
+        cdef cpysoem.ecx_contextt* ecx_contextt = self._ecx_contextt
+        cdef uint16_t pos = self._pos
+        cdef uint16_t result
+        if settings.always_release_gil:
+            with nogil:
+                result = cpysoem.ecx_statecheck(ecx_contextt, pos, expected_state, timeout)
+        else:
+            result = cpysoem.ecx_statecheck(ecx_contextt, pos, expected_state, timeout)
+        return result
         
     def reconfig(self, timeout=500):
         return cpysoem.ecx_reconfig_slave(self._ecx_contextt, self._pos, timeout)
@@ -637,6 +752,48 @@ cdef class CdefSlave:
         """
         cdef uint32_t tmp = cpysoem.ecx_readeeprom(self._ecx_contextt, self._pos, word_address, timeout)
         return PyBytes_FromStringAndSize(<char*>&tmp, 4)
+
+    def eeprom_read_bulk(self, int start_word, int num_words, int timeout=20000):
+        """Read a contiguous block of words from EEPROM
+
+        All words are read in one C loop without the GIL being held,
+        instead of one eeprom_read() call per 4 bytes.
+        Like eeprom_read(), a read access that failed is not detected,
+        SOEM returns 0 for it.
+
+        Default timeout: 20000 us per read access
+
+        Args:
+            start_word (int): EEPROM word address to start reading from
+            num_words (int): number of words (2 bytes each) to read
+            timeout (:obj:`int`, optional): Timeout value in us
+
+        Returns:
+            bytes: EEPROM data, num_words * 2 bytes
+
+        Raises:
+            ValueError: if num_words is negative or the words are not within the address range 0 to 0xFFFF
+        """
+        if num_words < 0:
+            raise ValueError('num_words must not be negative')
+        if start_word < 0 or start_word > 0xFFFF or start_word + num_words > 0x10000:
+            raise ValueError('{} words starting at {:#x} are out of the EEPROM address range'.format(num_words, start_word))
+        cdef cpysoem.ecx_contextt* ecx_contextt = self._ecx_contextt
+        cdef uint16_t pos = self._pos
+        cdef int i
+        cdef uint32_t tmp
+        # every read returns 4 bytes (2 words), reserve one extra word for an odd num_words
+        cdef unsigned char* pbuf = <unsigned char*>PyMem_Malloc((num_words + 1) * 2)
+        if pbuf == NULL:
+            raise MemoryError()
+        with nogil:
+            for i in range(0, num_words, 2):
+                tmp = cpysoem.ecx_readeeprom(ecx_contextt, pos, start_word + i, timeout)
+                memcpy(pbuf + 2 * i, <char*>&tmp, 4)
+        try:
+            return PyBytes_FromStringAndSize(<char*>pbuf, num_words * 2)
+        finally:
+            PyMem_Free(pbuf)
         
     def eeprom_write(self, int word_address, bytes data, timeout=20000):
         """Write 2 byte (1 word) to EEPROM
@@ -660,21 +817,38 @@ cdef class CdefSlave:
         if not result > 0:
             raise EepromError('EEPROM write error')
 
-    def foe_write(self, filename, password, bytes data, timeout = 200000):
+    def foe_write(self, filename, uint32_t password, const unsigned char[::1] data not None, int timeout = 200000, release_gil=None):
         """ Write given data to device using FoE
 
         Args:
             filename (string): name of the target file
             password (int): password for the target file, accepted range: 0 to 2^32 - 1
-            data (bytes): data
+            data (bytes-like): data, any contiguous buffer like bytes, bytearray or mmap is
+                accepted and is read without being copied
             timeout (int): Timeout value in us
+            release_gil (:obj:`bool`, optional): release the GIL during the transfer,
+                so that other Python threads can run in the meantime, defaults to settings.always_release_gil
         """
         # error handling
         if self._ecx_contextt == NULL:
             raise UnboundLocalError()
 
-        cdef int size = len(data)
-        cdef int result = cpysoem.ecx_FOEwrite(self._ecx_contextt, self._pos, filename.encode('utf8'), password, size, <unsigned char*>data, timeout)
+        cdef int size = data.shape[0]
+        cdef const unsigned char* pdata = NULL
+        if size > 0:
+            pdata = &data[0]
+        filename_bytes = filename.encode('utf8')
+        cdef char* pfilename = filename_bytes
+        cdef cpysoem.ecx_contextt* ecx_contextt = self._ecx_contextt
+        cdef uint16_t pos = self._pos
+        cdef int result
+        if release_gil is None:
+            release_gil = settings.always_release_gil
+        if release_gil:
+            with nogil:
+                result = cpysoem.ecx_FOEwrite(ecx_contextt, pos, pfilename, password, size, <unsigned char*>pdata, timeout)
+        else:
+            result = cpysoem.ecx_FOEwrite(ecx_contextt, pos, pfilename, password, size, <unsigned char*>pdata, timeout)
         
         # error handling
         cdef cpysoem.ec_errort err
@@ -781,6 +955,21 @@ cdef class CdefSlave:
     input = property(_get_input)
     config_func = property(_get_PO2SOconfig, _set_PO2SOconfig)
 
+    def input_view(self):
+        """Get a read-only view on the input process data of the slave.
+
+        In contrast to the input property no copy is made. The view points into the IO map of the master,
+        so it always shows the data of the latest receive_processdata() call.
+        Get the view after config_map() and do not use it after the Master instance is gone.
+
+        Returns:
+            memoryview: the input process data
+        """
+        num_bytes = self._ec_slave.Ibytes
+        if (self._ec_slave.Ibytes == 0 and self._ec_slave.Ibits > 0):
+            num_bytes = 1
+        return PyMemoryView_FromMemory(<char*>self._ec_slave.inputs, num_bytes, PyBUF_READ)
+
     def _get_state(self):
         return self._ec_slave.state
 
@@ -795,10 +984,29 @@ cdef class CdefSlave:
             num_bytes = 1
         return PyBytes_FromStringAndSize(<char*>self._ec_slave.outputs, num_bytes)
 
-    def _set_output(self, bytes value):
-        memcpy(<char*>self._ec_slave.outputs, <char*>value, len(value))
+    def _set_output(self, const unsigned char[::1] value not None):
+        # any contiguous buffer is accepted, e.g. bytes, bytearray or memoryview
+        cdef Py_ssize_t size = value.shape[0]
+        if size > 0:
+            memcpy(<char*>self._ec_slave.outputs, &value[0], size)
         
     output = property(_get_output, _set_output)
+
+    def output_view(self):
+        """Get a writable view on the output process data of the slave.
+
+        In contrast to assigning to the output property no bytes object is needed and nothing is copied,
+        writing to the view directly changes the IO map of the master that is sent by the next send_processdata() call.
+        Use for example struct.pack_into() to fill it.
+        Get the view after config_map() and do not use it after the Master instance is gone.
+
+        Returns:
+            memoryview: the output process data
+        """
+        num_bytes = self._ec_slave.Obytes
+        if (self._ec_slave.Obytes == 0 and self._ec_slave.Obits > 0):
+            num_bytes = 1
+        return PyMemoryView_FromMemory(<char*>self._ec_slave.outputs, num_bytes, PyBUF_WRITE)
     
     def _get_al_status(self):
         return self._ec_slave.ALstatuscode
@@ -842,11 +1050,13 @@ cdef class CdefCoeObject:
     cdef cpysoem.boolean _is_description_read
     cdef cpysoem.boolean _are_entries_read
     cdef cpysoem.ec_OElistt _ex_oelist
+    cdef list _entries
     
     def __init__(self, int item):
         self._item = item
         self._is_description_read = False
         self._are_entries_read = False
+        self._entries = None
         
     def _read_description(self):
         cdef int result
@@ -890,18 +1100,21 @@ cdef class CdefCoeObject:
     name = property(_get_name)
     
     def _get_entries(self):
+        # the entry list is built once per object, a new od read creates new objects anyway
+        if self._entries is not None:
+            return self._entries
+
         self._read_description()
         self._read_entries()
         
-        if self._ex_odlist.MaxSub[self._item] == 0:
-            return []
-        else:
-            entries = []
+        entries = []
+        if self._ex_odlist.MaxSub[self._item] > 0:
             for i in range(self._ex_odlist.MaxSub[self._item]+1):
                 entry = CdefCoeObjectEntry(i)
                 entry._ex_oelist = &self._ex_oelist
                 entries.append(entry)
-            return entries
+        self._entries = entries
+        return entries
 
     entries = property(_get_entries)
     
@@ -953,7 +1166,68 @@ cdef class CdefCoeObjectEntry:
         return self._ex_oelist.ObjAccess[self._item]
     
     obj_access = property(_get_obj_access)
-        
+
+
+cdef class PdoRing:
+    """Ring buffer holding the latest snapshots of the input process data.
+
+    The ring passes the input process data from a thread that runs the EtherCAT cycle to a consumer thread,
+    without creating a bytes object per cycle.
+    The cycle thread calls commit() after each receive_processdata(), the consumer calls latest_view().
+    There must be only one writer and one reader.
+    Both methods run while holding the GIL, so no further locking is needed between the two.
+
+    Create the ring after config_map() or config_overlap_map() was called on the master.
+
+    Args:
+        master (CdefMaster): the master whose input process data is stored
+        capacity (int): number of snapshots in the ring, must be a power of two (default 16)
+
+    Raises:
+        ValueError: if capacity is not a power of two
+    """
+    cdef CdefMaster _master
+    cdef bytearray _buffer
+    cdef object _view
+    cdef unsigned char* _pbuf
+    cdef uint32_t _size
+    cdef uint64_t _mask
+    cdef uint64_t _head
+
+    def __init__(self, CdefMaster master not None, int capacity=16):
+        if capacity <= 0 or (capacity & (capacity - 1)) != 0:
+            raise ValueError('capacity must be a power of two')
+        self._master = master
+        self._size = master._ec_group[0].Ibytes
+        self._mask = capacity - 1
+        self._head = 0
+        self._buffer = bytearray(capacity * self._size)
+        self._pbuf = <unsigned char*><char*>self._buffer
+        self._view = memoryview(self._buffer).toreadonly()
+
+    def commit(self):
+        """Copy the current input process data of the master into the next slot of the ring."""
+        memcpy(self._pbuf + (self._head & self._mask) * self._size, self._master._ec_group[0].inputs, self._size)
+        self._head += 1
+
+    def latest_view(self):
+        """Get a read-only view on the latest committed snapshot.
+
+        The view stays valid until capacity further commits were made, after that the slot is overwritten.
+
+        Returns:
+            memoryview: the latest snapshot, None if nothing was committed so far
+        """
+        if self._head == 0:
+            return None
+        cdef uint64_t start = ((self._head - 1) & self._mask) * self._size
+        return self._view[start:start + self._size]
+
+    def _get_head(self):
+        return self._head
+
+    head = property(_get_head)
+
 
 cdef int _xPO2SOconfig(cpysoem.uint16 slave, void* user):
     assert(slave>0)   
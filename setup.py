@@ -17,17 +17,44 @@ else:
 soem_sources = []
 soem_inc_dirs = []
 
+# set PYSOEM_NATIVE=1 to tune the build for the CPU of the build machine, the result is not portable
+native_build = os.environ.get('PYSOEM_NATIVE') == '1'
+# profile guided optimization: build with PYSOEM_PGO=generate, run tools/pgo_train.py,
+# then rebuild with PYSOEM_PGO=use, PYSOEM_PGO_DIR is where the profile data is kept
+pgo_mode = os.environ.get('PYSOEM_PGO')
+pgo_dir = os.path.abspath(os.environ.get('PYSOEM_PGO_DIR', 'pgo-data'))
+if pgo_mode not in (None, 'generate', 'use'):
+    raise RuntimeError('PYSOEM_PGO must be either "generate" or "use"')
+
 if sys.platform.startswith('win'):
     soem_macros = [('WIN32', ''), ('_CRT_SECURE_NO_WARNINGS', '')]
     soem_lib_dirs = [os.path.join('.', 'soem', 'oshw', 'win32', 'wpcap', 'Lib', 'x64')]
     soem_libs = ['wpcap', 'Packet', 'Ws2_32', 'Winmm']
     soem_inc_dirs.append(os.path.join('.', 'soem', 'oshw', 'win32', 'wpcap', 'Include'))
     os_name = 'win32'
+    extra_compile_args = ['/O2', '/GL']
+    extra_link_args = ['/LTCG']
+    if native_build:
+        extra_compile_args.append('/arch:AVX2')
+    if pgo_mode == 'generate':
+        extra_link_args.append('/GENPROFILE:PGD={}'.format(os.path.join(pgo_dir, 'pysoem.pgd')))
+    elif pgo_mode == 'use':
+        extra_link_args.append('/USEPROFILE:PGD={}'.format(os.path.join(pgo_dir, 'pysoem.pgd')))
 elif sys.platform.startswith('linux'):
     soem_macros = []
     soem_lib_dirs = []
     soem_libs = ['pthread', 'rt'] 
     os_name = 'linux'
+    extra_compile_args = ['-O3', '-flto', '-fno-plt']
+    extra_link_args = ['-flto']
+    if native_build:
+        extra_compile_args.append('-march=native')
+    if pgo_mode == 'generate':
+        extra_compile_args.append('-fprofile-generate={}'.format(pgo_dir))
+        extra_link_args.append('-fprofile-generate={}'.format(pgo_dir))
+    elif pgo_mode == 'use':
+        extra_compile_args.extend(['-fprofile-use={}'.format(pgo_dir), '-fprofile-correction'])
+        extra_link_args.append('-fprofile-use={}'.format(pgo_dir))
 
 soem_macros.append(('EC_VER2', ''))
 
@@ -82,13 +109,21 @@ extensions = [
         define_macros=soem_macros,
         libraries=soem_libs,
         library_dirs=soem_lib_dirs,
-        include_dirs=['./pysoem'] + soem_inc_dirs
+        include_dirs=['./pysoem'] + soem_inc_dirs,
+        extra_compile_args=extra_compile_args,
+        extra_link_args=extra_link_args
     )
 ]
 
 if USE_CYTHON:
     from Cython.Build import cythonize
-    extensions = cythonize(extensions)
+    # raw memoryview/pointer access in pysoem.pyx is guarded explicitly, no need for Cython's runtime checks
+    extensions = cythonize(extensions, compiler_directives={'language_level': 3,
+                                                            'boundscheck': False,
+                                                            'wraparound': False,
+                                                            'initializedcheck': False,
+                                                            'cdivision': True,
+                                                            'nonecheck': False})
 
 setup(name='pysoem',
       version=find_version("pysoem", "__init__.py"),
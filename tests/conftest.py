@@ -1,7 +1,9 @@
 
 
+import os
 import time
 import collections
+import logging
 import threading
 import pytest
 
@@ -12,6 +14,11 @@ def pytest_addoption(parser):
     parser.addoption('--ifname', action='store')
 
 
+logger = logging.getLogger('pysoem.test')
+
+SlaveSet = collections.namedtuple('SlaveSet', 'name vendor_id product_code')
+
+
 class PySoemTestEnvironment:
     """Setup a basic pysoem test fixture that is needed for most of tests"""
 
@@ -20,6 +27,23 @@ class PySoemTestEnvironment:
     EL3002_PRODUCT_CODE = 0x0bba3052
     EL1259_PRODUCT_CODE = 0x04eb3052
 
+    PD_CYCLE_TIME = 0.01
+
+    # indexed by slave position
+    _EXPECTED_SLAVE_LAYOUT = (
+        SlaveSet('XMC43-Test-Device', 0, 0x12783456),
+        SlaveSet('EK1100', BECKHOFF_VENDOR_ID, EK1100_PRODUCT_CODE),
+        SlaveSet('EL3002', BECKHOFF_VENDOR_ID, EL3002_PRODUCT_CODE),
+        SlaveSet('EL1259', BECKHOFF_VENDOR_ID, EL1259_PRODUCT_CODE),
+    )
+
+    # EC_TIMEOUTSTATE of SOEM in s, the timeout argument of reconfig()/recover() is in us and only covers single frames
+    EC_TIMEOUTSTATE = 2.0
+    # ecx_reconfig_slave waits for up to three state changes (INIT, PREOP, SAFEOP) and a check pass
+    # may reconfigure every slave, so the check thread can be busy that long before it sees its stop event,
+    # the extra second covers recover() and the frames around the state changes
+    THREAD_JOIN_TIMEOUT = len(_EXPECTED_SLAVE_LAYOUT) * 3 * EC_TIMEOUTSTATE + 1.0
+
     def __init__(self, ifname):
         self._ifname = ifname
         self._master = pysoem.Master()
@@ -27,66 +51,128 @@ class PySoemTestEnvironment:
         self._master.do_check_state = False
         self._proc_thread_handle = None
         self._check_thread_handle = None
-        self._pd_thread_stop_event = threading.Event()
-        self._ch_thread_stop_event = threading.Event()
+        self._pd_thread_stop_event = None
+        self._ch_thread_stop_event = None
         self._actual_wkc = 0
+        self._previous_always_release_gil = None
 
-        self.SlaveSet = collections.namedtuple('SlaveSet', 'name vendor_id product_code config_func')
+        self._config_funcs = {}
+        self._setup_key = None
+        self._is_open = False
+        self._setup_succeeded = False
 
-        self.el3002_config_func = None
-        self.el1259_config_func = None
-        self._expected_slave_layout = None
+    def setup(self, force=False):
+        """Open the master and bring all slaves to SAFEOP.
 
-    def setup(self):
+        A repeated call with the same config functions does nothing if go_to_op_state() was not
+        called in between and all slaves are still in SAFEOP. Otherwise, or if force is True, an already open
+        master is torn down first and configured from scratch.
+        """
+        setup_key = dict(self._config_funcs)
+        if setup_key == self._setup_key and not force and self._is_reusable():
+            return
+
+        if self._is_open:
+            # config_init on an open master would append the slaves a second time and leak the socket
+            self.teardown()
 
-        self._expected_slave_layout = {
-            0: self.SlaveSet('XMC43-Test-Device', 0, 0x12783456, None),
-            1: self.SlaveSet('EK1100', self.BECKHOFF_VENDOR_ID, self.EK1100_PRODUCT_CODE, None),
-            2: self.SlaveSet('EL3002', self.BECKHOFF_VENDOR_ID, self.EL3002_PRODUCT_CODE, self.el3002_config_func),
-            3: self.SlaveSet('EL1259', self.BECKHOFF_VENDOR_ID, self.EL1259_PRODUCT_CODE, self.el1259_config_func),
-        }
         self._master.open(self._ifname)
+        # let the process data thread and the check thread run while the other one waits in SOEM,
+        # switched only after open() succeeded so that _close() always restores it
+        self._previous_always_release_gil = pysoem.settings.always_release_gil
+        pysoem.settings.always_release_gil = True
+        self._is_open = True
+        self._setup_succeeded = False
 
         assert self._master.config_init(False) > 0
 
         self._master.config_dc()
         for i, slave in enumerate(self._master.slaves):
-            assert slave.man == self._expected_slave_layout[i].vendor_id
-            assert slave.id == self._expected_slave_layout[i].product_code
-            slave.config_func = self._expected_slave_layout[i].config_func
+            expected_slave = self._EXPECTED_SLAVE_LAYOUT[i]
+            assert slave.man == expected_slave.vendor_id
+            assert slave.id == expected_slave.product_code
+            slave.config_func = self._config_funcs.get(i)
             slave.is_lost = False
 
         self._master.config_map()
         assert self._master.state_check(pysoem.SAFEOP_STATE) == pysoem.SAFEOP_STATE
+        self._setup_key = setup_key
+        self._setup_succeeded = True
+
+    def _is_reusable(self):
+        """True if the current setup is still in the state setup() leaves it in"""
+        if self._proc_thread_handle or self._check_thread_handle:
+            return False
+        return self._master.read_state() == pysoem.SAFEOP_STATE
 
     def go_to_op_state(self):
         self._master.state = pysoem.OP_STATE
 
-        self._proc_thread_handle = threading.Thread(target=self._processdata_thread)
+        # fresh events for every run, each thread only ever sees the event it was started with
+        self._pd_thread_stop_event = threading.Event()
+        self._ch_thread_stop_event = threading.Event()
+        self._proc_thread_handle = threading.Thread(target=self._processdata_thread,
+                                                    args=(self._pd_thread_stop_event,), daemon=True)
         self._proc_thread_handle.start()
-        self._check_thread_handle = threading.Thread(target=self._check_thread)
+        self._check_thread_handle = threading.Thread(target=self._check_thread,
+                                                     args=(self._ch_thread_stop_event,), daemon=True)
         self._check_thread_handle.start()
 
         self._master.write_state()
-        for _ in range(400):
-            self._master.state_check(pysoem.OP_STATE, 50000)
-            if self._master.state == pysoem.OP_STATE:
-                all_slaves_reached_op_state = True
-                break
-        assert 'all_slaves_reached_op_state' in locals(), 'could not reach OP state'
+        # statecheck polls the slaves on its own until OP is reached or the timeout (20 s) expired
+        all_slaves_reached_op_state = self._master.state_check(pysoem.OP_STATE, 400*50000) == pysoem.OP_STATE
+        assert all_slaves_reached_op_state, 'could not reach OP state'
         self._master.in_op = True
 
     def teardown(self):
-        self._pd_thread_stop_event.set()
-        self._ch_thread_stop_event.set()
-        if self._proc_thread_handle:
-            self._proc_thread_handle.join()
-        if self._check_thread_handle:
-            self._check_thread_handle.join()
+        """Stop the threads and close the master, calling it again without a new setup() does nothing
+
+        If a thread does not stop in time, RuntimeError is raised and the master stays open,
+        a later call tries again.
+        """
+        if not self._is_open:
+            return
+        if not self._setup_succeeded:
+            # setup() failed half way, e.g. in a config function, don't send state requests that just time out
+            self._close()
+            return
+
+        for stop_event in (self._pd_thread_stop_event, self._ch_thread_stop_event):
+            if stop_event:
+                stop_event.set()
+        for thread_handle in (self._proc_thread_handle, self._check_thread_handle):
+            if thread_handle:
+                thread_handle.join(self.THREAD_JOIN_TIMEOUT)
+                if thread_handle.is_alive():
+                    # the thread still uses the master, closing or reopening it now would pull it away underneath
+                    raise RuntimeError('{} did not stop within {} s, the master is left open'.format(
+                        thread_handle.name, self.THREAD_JOIN_TIMEOUT))
+        self._proc_thread_handle = None
+        self._check_thread_handle = None
+        self._pd_thread_stop_event = None
+        self._ch_thread_stop_event = None
+        self._master.in_op = False
 
         self._master.state = pysoem.INIT_STATE
         self._master.write_state()
+        self._close()
+
+    def _close(self):
         self._master.close()
+        self._is_open = False
+        self._setup_succeeded = False
+        self._setup_key = None
+        pysoem.settings.always_release_gil = self._previous_always_release_gil
+
+    def set_config_func(self, slave_pos, config_func):
+        """Set the config function of the slave at slave_pos, it is applied by the next setup()
+
+        If the master is already set up, the next setup() tears it down and configures it from scratch.
+        """
+        if self._config_funcs.get(slave_pos) != config_func:
+            self._config_funcs[slave_pos] = config_func
+            # the current configuration is stale now
+            self._setup_key = None
 
     def get_master(self):
         return self._master
@@ -100,55 +186,68 @@ class PySoemTestEnvironment:
     def get_slave_without_foe_support(self):
         return self._master.slaves[2]  # the EL3002
 
-    def _processdata_thread(self):
-        while not self._pd_thread_stop_event.is_set():
-            self._master.send_processdata()
-            self._actual_wkc = self._master.receive_processdata(10000)
-            time.sleep(0.01)
+    def _processdata_thread(self, stop_event):
+        cycle = self._master.cycle
+        stop_event_wait = stop_event.wait
+        # cycle on an absolute grid, so the time spent in cycle() does not add up as drift
+        deadline = time.monotonic()
+        while True:
+            self._actual_wkc = cycle(10000)
+            deadline += self.PD_CYCLE_TIME
+            now = time.monotonic()
+            if deadline < now:
+                # overrun, start a new grid instead of catching up with a burst of cycles
+                deadline = now
+            if stop_event_wait(deadline - now):
+                break
 
     @staticmethod
     def _check_slave(slave, pos):
         if slave.state == (pysoem.SAFEOP_STATE + pysoem.STATE_ERROR):
-            print(
-                'ERROR : slave {} is in SAFE_OP + ERROR, attempting ack.'.format(pos))
+            logger.error('slave %d is in SAFE_OP + ERROR, attempting ack.', pos)
             slave.state = pysoem.SAFEOP_STATE + pysoem.STATE_ACK
             slave.write_state()
         elif slave.state == pysoem.SAFEOP_STATE:
-            print(
-                'WARNING : slave {} is in SAFE_OP, try change to OPERATIONAL.'.format(pos))
+            logger.warning('slave %d is in SAFE_OP, try change to OPERATIONAL.', pos)
             slave.state = pysoem.OP_STATE
             slave.write_state()
         elif slave.state > pysoem.NONE_STATE:
             if slave.reconfig():
                 slave.is_lost = False
-                print('MESSAGE : slave {} reconfigured'.format(pos))
+                logger.info('slave %d reconfigured', pos)
         elif not slave.is_lost:
             slave.state_check(pysoem.OP_STATE)
             if slave.state == pysoem.NONE_STATE:
                 slave.is_lost = True
-                print('ERROR : slave {} lost'.format(pos))
+                logger.error('slave %d lost', pos)
         if slave.is_lost:
             if slave.state == pysoem.NONE_STATE:
                 if slave.recover():
                     slave.is_lost = False
-                    print(
-                        'MESSAGE : slave {} recovered'.format(pos))
+                    logger.info('slave %d recovered', pos)
             else:
                 slave.is_lost = False
-                print('MESSAGE : slave {} found'.format(pos))
-
-    def _check_thread(self):
-        while not self._ch_thread_stop_event.is_set():
-            if self._master.in_op and ((self._actual_wkc < self._master.expected_wkc) or self._master.do_check_state):
-                self._master.do_check_state = False
-                self._master.read_state()
-                for i, slave in enumerate(self._master.slaves):
-                    if slave.state != pysoem.OP_STATE:
-                        self._master.do_check_state = True
-                        self._check_slave(slave, i)
-                if not self._master.do_check_state:
-                    print('OK : all slaves resumed OPERATIONAL.')
-            time.sleep(0.01)
+                logger.info('slave %d found', pos)
+
+    def _check_thread(self, stop_event):
+        master = self._master
+        # the thread is started after config_map, the expected working counter does not change anymore
+        expected_wkc = master.expected_wkc
+        slaves = master.slaves
+        all_in_op = bytes([pysoem.OP_STATE]) * len(slaves)
+        while not stop_event.wait(0.01):
+            if master.in_op and ((self._actual_wkc < expected_wkc) or master.do_check_state):
+                do_check_state = False
+                master.read_state()
+                slave_states = master.slave_states
+                if slave_states != all_in_op:
+                    for i, state in enumerate(slave_states):
+                        if state != pysoem.OP_STATE:
+                            do_check_state = True
+                            self._check_slave(slaves[i], i)
+                master.do_check_state = do_check_state
+                if not do_check_state:
+                    logger.info('all slaves resumed OPERATIONAL.')
 
 
 @pytest.fixture
@@ -156,3 +255,29 @@ def pysoem_environment(request):
     env = PySoemTestEnvironment(request.config.getoption('--ifname'))
     yield env
     env.teardown()
+
+
+@pytest.fixture(scope='module')
+def pysoem_environment_module(request):
+    """An already set up environment that is shared by all tests of a module.
+
+    Only use it in tests that do not need own config functions and do not change the state of the slaves.
+    It is torn down when the module is done, so the master is closed again before other modules
+    open their own master on the same interface.
+    """
+    env = PySoemTestEnvironment(request.config.getoption('--ifname'))
+    # registered before setup(), so a setup that fails after open() still closes the master
+    request.addfinalizer(env.teardown)
+    env.setup()
+    return env
+
+
+@pytest.fixture(scope='session')
+def foe_blobs():
+    """The content of the FoE test files, read once per session"""
+    base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'foe_testdata')
+    blobs = []
+    for file_name in ['random_data_01.bin', 'random_data_02.bin']:
+        with open(os.path.join(base_path, file_name), 'rb') as file:
+            blobs.append(file.read())
+    return blobs
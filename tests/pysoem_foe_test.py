@@ -3,14 +3,10 @@ import pytest
 import pysoem
 
 
-def test_foe_good(pysoem_environment):
-    pysoem_environment.setup()
-    test_slave = pysoem_environment.get_slave_for_foe_testing()
-
-    for file_path in ['./foe_testdata/random_data_01.bin', './foe_testdata/random_data_02.bin']:
-        with open(file_path, 'rb') as file:
-            random_data = file.read()
+def test_foe_good(pysoem_environment_module, foe_blobs):
+    test_slave = pysoem_environment_module.get_slave_for_foe_testing()
 
+    for random_data in foe_blobs:
         # write
         test_slave.foe_write('test.bin', 0, random_data)
         # read back
@@ -19,9 +15,8 @@ def test_foe_good(pysoem_environment):
         assert reread_data[:len(random_data)] == random_data
 
 
-def test_foe_fails(pysoem_environment):
-    pysoem_environment.setup()
-    test_slave = pysoem_environment.get_slave_without_foe_support()
+def test_foe_fails(pysoem_environment_module):
+    test_slave = pysoem_environment_module.get_slave_without_foe_support()
 
     # expect foe READ to fail
     with pytest.raises(pysoem.MailboxError) as excinfo:
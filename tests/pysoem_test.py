@@ -1,6 +1,6 @@
 """Run some basic tests against an Beckhoff EL1259
 
-This test expects a physical slave layout according to PySoemTestEnvironment._expected_slave_layout, see below.
+This test expects a physical slave layout according to PySoemTestEnvironment._EXPECTED_SLAVE_LAYOUT, see below.
 
 Run this tests with the unit testing framework that comes with python: `python -m unittest pysoem_test`.
 
@@ -16,6 +16,7 @@ Thees values must reflect your setup.
 import time
 import unittest
 import collections
+import logging
 import struct
 import threading
 
@@ -24,6 +25,13 @@ import pysoem
 import test_config
 
 
+_U32 = struct.Struct('<I')
+
+logger = logging.getLogger('pysoem.test')
+
+SlaveSet = collections.namedtuple('SlaveSet', 'name vendor_id product_code')
+
+
 class PySoemTestEnvironment:
     """Setup a basic pysoem test fixture that is needed for most of tests"""
 
@@ -32,6 +40,23 @@ class PySoemTestEnvironment:
     EL3002_PRODUCT_CODE = 0x0bba3052
     EL1259_PRODUCT_CODE = 0x04eb3052
 
+    PD_CYCLE_TIME = 0.01
+
+    # indexed by slave position
+    _EXPECTED_SLAVE_LAYOUT = (
+        SlaveSet('XMC43-Test-Device', 0, 0x12783456),
+        SlaveSet('EK1100', BECKHOFF_VENDOR_ID, EK1100_PRODUCT_CODE),
+        SlaveSet('EL3002', BECKHOFF_VENDOR_ID, EL3002_PRODUCT_CODE),
+        SlaveSet('EL1259', BECKHOFF_VENDOR_ID, EL1259_PRODUCT_CODE),
+    )
+
+    # EC_TIMEOUTSTATE of SOEM in s, the timeout argument of reconfig()/recover() is in us and only covers single frames
+    EC_TIMEOUTSTATE = 2.0
+    # ecx_reconfig_slave waits for up to three state changes (INIT, PREOP, SAFEOP) and a check pass
+    # may reconfigure every slave, so the check thread can be busy that long before it sees its stop event,
+    # the extra second covers recover() and the frames around the state changes
+    THREAD_JOIN_TIMEOUT = len(_EXPECTED_SLAVE_LAYOUT) * 3 * EC_TIMEOUTSTATE + 1.0
+
     def __init__(self):
         self._is_overlapping_enabled = None
         self._ifname = test_config.ifname
@@ -40,34 +65,48 @@ class PySoemTestEnvironment:
         self._master.do_check_state = False
         self._proc_thread_handle = None
         self._check_thread_handle = None
-        self._pd_thread_stop_event = threading.Event()
-        self._ch_thread_stop_event = threading.Event()
+        self._pd_thread_stop_event = None
+        self._ch_thread_stop_event = None
         self._actual_wkc = 0
+        self._previous_always_release_gil = None
 
-        self.SlaveSet = collections.namedtuple('SlaveSet', 'name vendor_id product_code config_func')
+        self._config_funcs = {}
+        self._setup_key = None
+        self._is_open = False
+        self._setup_succeeded = False
 
-        self.el3002_config_func = None
-        self.el1259_config_func = None
-        self._expected_slave_layout = None
+    def setup(self, overlapping_enable=False, force=False):
+        """Open the master and bring all slaves to SAFEOP.
 
-    def setup(self, overlapping_enable=False):
+        A repeated call with the same overlap mode and config functions does nothing if go_to_op_state() was not
+        called in between and all slaves are still in SAFEOP. Otherwise, or if force is True, an already open
+        master is torn down first and configured from scratch.
+        """
+        setup_key = (overlapping_enable, dict(self._config_funcs))
+        if setup_key == self._setup_key and not force and self._is_reusable():
+            return
         self._is_overlapping_enabled = overlapping_enable
 
-        self._expected_slave_layout = {
-            0: self.SlaveSet('XMC43-Test-Device', 0, 0x12783456, None),
-            1: self.SlaveSet('EK1100', self.BECKHOFF_VENDOR_ID, self.EK1100_PRODUCT_CODE, None),
-            2: self.SlaveSet('EL3002', self.BECKHOFF_VENDOR_ID, self.EL3002_PRODUCT_CODE, self.el3002_config_func),
-            3: self.SlaveSet('EL1259', self.BECKHOFF_VENDOR_ID, self.EL1259_PRODUCT_CODE, self.el1259_config_func),
-        }
+        if self._is_open:
+            # config_init on an open master would append the slaves a second time and leak the socket
+            self.teardown()
+
         self._master.open(self._ifname)
+        # let the process data thread and the check thread run while the other one waits in SOEM,
+        # switched only after open() succeeded so that _close() always restores it
+        self._previous_always_release_gil = pysoem.settings.always_release_gil
+        pysoem.settings.always_release_gil = True
+        self._is_open = True
+        self._setup_succeeded = False
 
         assert self._master.config_init(False) > 0
 
         self._master.config_dc()
         for i, slave in enumerate(self._master.slaves):
-            assert slave.man == self._expected_slave_layout[i].vendor_id
-            assert slave.id == self._expected_slave_layout[i].product_code
-            slave.config_func = self._expected_slave_layout[i].config_func
+            expected_slave = self._EXPECTED_SLAVE_LAYOUT[i]
+            assert slave.man == expected_slave.vendor_id
+            assert slave.id == expected_slave.product_code
+            slave.config_func = self._config_funcs.get(i)
             slave.is_lost = False
 
         if self._is_overlapping_enabled:
@@ -75,35 +114,83 @@ class PySoemTestEnvironment:
         else:
             self._master.config_map()
         assert self._master.state_check(pysoem.SAFEOP_STATE) == pysoem.SAFEOP_STATE
+        self._setup_key = setup_key
+        self._setup_succeeded = True
+
+    def _is_reusable(self):
+        """True if the current setup is still in the state setup() leaves it in"""
+        if self._proc_thread_handle or self._check_thread_handle:
+            return False
+        return self._master.read_state() == pysoem.SAFEOP_STATE
 
     def go_to_op_state(self):
         self._master.state = pysoem.OP_STATE
 
-        self._proc_thread_handle = threading.Thread(target=self._processdata_thread)
+        # fresh events for every run, each thread only ever sees the event it was started with
+        self._pd_thread_stop_event = threading.Event()
+        self._ch_thread_stop_event = threading.Event()
+        self._proc_thread_handle = threading.Thread(target=self._processdata_thread,
+                                                    args=(self._pd_thread_stop_event,), daemon=True)
         self._proc_thread_handle.start()
-        self._check_thread_handle = threading.Thread(target=self._check_thread)
+        self._check_thread_handle = threading.Thread(target=self._check_thread,
+                                                     args=(self._ch_thread_stop_event,), daemon=True)
         self._check_thread_handle.start()
 
         self._master.write_state()
-        for _ in range(400):
-            self._master.state_check(pysoem.OP_STATE, 50000)
-            if self._master.state == pysoem.OP_STATE:
-                all_slaves_reached_op_state = True
-                break
-        assert 'all_slaves_reached_op_state' in locals(), 'could not reach OP state'
+        # statecheck polls the slaves on its own until OP is reached or the timeout (20 s) expired
+        all_slaves_reached_op_state = self._master.state_check(pysoem.OP_STATE, 400*50000) == pysoem.OP_STATE
+        assert all_slaves_reached_op_state, 'could not reach OP state'
         self._master.in_op = True
 
     def teardown(self):
-        self._pd_thread_stop_event.set()
-        self._ch_thread_stop_event.set()
-        if self._proc_thread_handle:
-            self._proc_thread_handle.join()
-        if self._check_thread_handle:
-            self._check_thread_handle.join()
+        """Stop the threads and close the master, calling it again without a new setup() does nothing
+
+        If a thread does not stop in time, RuntimeError is raised and the master stays open,
+        a later call tries again.
+        """
+        if not self._is_open:
+            return
+        if not self._setup_succeeded:
+            # setup() failed half way, e.g. in a config function, don't send state requests that just time out
+            self._close()
+            return
+
+        for stop_event in (self._pd_thread_stop_event, self._ch_thread_stop_event):
+            if stop_event:
+                stop_event.set()
+        for thread_handle in (self._proc_thread_handle, self._check_thread_handle):
+            if thread_handle:
+                thread_handle.join(self.THREAD_JOIN_TIMEOUT)
+                if thread_handle.is_alive():
+                    # the thread still uses the master, closing or reopening it now would pull it away underneath
+                    raise RuntimeError('{} did not stop within {} s, the master is left open'.format(
+                        thread_handle.name, self.THREAD_JOIN_TIMEOUT))
+        self._proc_thread_handle = None
+        self._check_thread_handle = None
+        self._pd_thread_stop_event = None
+        self._ch_thread_stop_event = None
+        self._master.in_op = False
 
         self._master.state = pysoem.INIT_STATE
         self._master.write_state()
+        self._close()
+
+    def _close(self):
         self._master.close()
+        self._is_open = False
+        self._setup_succeeded = False
+        self._setup_key = None
+        pysoem.settings.always_release_gil = self._previous_always_release_gil
+
+    def set_config_func(self, slave_pos, config_func):
+        """Set the config function of the slave at slave_pos, it is applied by the next setup()
+
+        If the master is already set up, the next setup() tears it down and configures it from scratch.
+        """
+        if self._config_funcs.get(slave_pos) != config_func:
+            self._config_funcs[slave_pos] = config_func
+            # the current configuration is stale now
+            self._setup_key = None
 
     def get_master(self):
         return self._master
@@ -111,58 +198,71 @@ class PySoemTestEnvironment:
     def get_slaves(self):
         return self._master.slaves
 
-    def _processdata_thread(self):
-        while not self._pd_thread_stop_event.is_set():
-            if self._is_overlapping_enabled:
-                self._master.send_overlap_processdata()
-            else:
-                self._master.send_processdata()
-            self._actual_wkc = self._master.receive_processdata(10000)
-            time.sleep(0.01)
+    def _processdata_thread(self, stop_event):
+        if self._is_overlapping_enabled:
+            cycle = self._master.overlap_cycle
+        else:
+            cycle = self._master.cycle
+        stop_event_wait = stop_event.wait
+        # cycle on an absolute grid, so the time spent in cycle() does not add up as drift
+        deadline = time.monotonic()
+        while True:
+            self._actual_wkc = cycle(10000)
+            deadline += self.PD_CYCLE_TIME
+            now = time.monotonic()
+            if deadline < now:
+                # overrun, start a new grid instead of catching up with a burst of cycles
+                deadline = now
+            if stop_event_wait(deadline - now):
+                break
 
     @staticmethod
     def _check_slave(slave, pos):
         if slave.state == (pysoem.SAFEOP_STATE + pysoem.STATE_ERROR):
-            print(
-                'ERROR : slave {} is in SAFE_OP + ERROR, attempting ack.'.format(pos))
+            logger.error('slave %d is in SAFE_OP + ERROR, attempting ack.', pos)
             slave.state = pysoem.SAFEOP_STATE + pysoem.STATE_ACK
             slave.write_state()
         elif slave.state == pysoem.SAFEOP_STATE:
-            print(
-                'WARNING : slave {} is in SAFE_OP, try change to OPERATIONAL.'.format(pos))
+            logger.warning('slave %d is in SAFE_OP, try change to OPERATIONAL.', pos)
             slave.state = pysoem.OP_STATE
             slave.write_state()
         elif slave.state > pysoem.NONE_STATE:
             if slave.reconfig():
                 slave.is_lost = False
-                print('MESSAGE : slave {} reconfigured'.format(pos))
+                logger.info('slave %d reconfigured', pos)
         elif not slave.is_lost:
             slave.state_check(pysoem.OP_STATE)
             if slave.state == pysoem.NONE_STATE:
                 slave.is_lost = True
-                print('ERROR : slave {} lost'.format(pos))
+                logger.error('slave %d lost', pos)
         if slave.is_lost:
             if slave.state == pysoem.NONE_STATE:
                 if slave.recover():
                     slave.is_lost = False
-                    print(
-                        'MESSAGE : slave {} recovered'.format(pos))
+                    logger.info('slave %d recovered', pos)
             else:
                 slave.is_lost = False
-                print('MESSAGE : slave {} found'.format(pos))
-
-    def _check_thread(self):
-        while not self._ch_thread_stop_event.is_set():
-            if self._master.in_op and ((self._actual_wkc < self._master.expected_wkc) or self._master.do_check_state):
-                self._master.do_check_state = False
-                self._master.read_state()
-                for i, slave in enumerate(self._master.slaves):
-                    if slave.state != pysoem.OP_STATE:
-                        self._master.do_check_state = True
-                        self._check_slave(slave, i)
-                if not self._master.do_check_state:
-                    print('OK : all slaves resumed OPERATIONAL.')
-            time.sleep(0.01)
+                logger.info('slave %d found', pos)
+
+    def _check_thread(self, stop_event):
+        master = self._master
+        # the thread is started after config_map, the expected working counter does not change anymore
+        expected_wkc = master.expected_wkc
+        slaves = master.slaves
+        all_in_op = bytes([pysoem.OP_STATE]) * len(slaves)
+        while not stop_event.wait(0.01):
+            if master.in_op and ((self._actual_wkc < expected_wkc) or master.do_check_state):
+                do_check_state = False
+                master.read_state()
+                slave_states = master.slave_states
+                if slave_states != all_in_op:
+                    for i, state in enumerate(slave_states):
+                        if state != pysoem.OP_STATE:
+                            do_check_state = True
+                            self._check_slave(slaves[i], i)
+                master.do_check_state = do_check_state
+                if not do_check_state:
+                    logger.info('all slaves resumed OPERATIONAL.')
 
 
 class PySoemTest(unittest.TestCase):
@@ -183,7 +283,7 @@ class PySoemTestConfigFunc(unittest.TestCase):
         raise self.MyVeryOwnExceptionType()
 
     def test(self):
-        self._test_env.el1259_config_func = self.el1259_config_func
+        self._test_env.set_config_func(3, self.el1259_config_func)
 
         with self.assertRaises(self.MyVeryOwnExceptionType) as ex:
             self._test_env.setup()
@@ -193,30 +293,72 @@ class PySoemTestConfigFunc(unittest.TestCase):
         self._test_env.teardown()
 
 
-class PySoemTestSdo(unittest.TestCase):
-    """Test SDO communication"""
+class PySoemTestSetup(unittest.TestCase):
+    """Check that the test environment can be set up again on the same master"""
 
     def setUp(self):
         self._test_env = PySoemTestEnvironment()
+        self._config_func_calls = []
+
+    def el1259_config_func(self, slave_pos):
+        self._config_func_calls.append(slave_pos)
+
+    def test_setup_twice_with_different_config(self):
+        self._test_env.setup()
+        number_of_slaves = len(self._test_env.get_slaves())
+        self.assertEqual(number_of_slaves, len(PySoemTestEnvironment._EXPECTED_SLAVE_LAYOUT))
+
+        self._test_env.set_config_func(3, self.el1259_config_func)
+        self._test_env.setup()
+        self.assertEqual(len(self._test_env.get_slaves()), number_of_slaves)
+        self.assertEqual(self._config_func_calls, [3])
+
+        self._test_env.setup(force=True)
+        self.assertEqual(len(self._test_env.get_slaves()), number_of_slaves)
+        self.assertEqual(self._config_func_calls, [3, 3])
+
+    def test_setup_after_op_state(self):
+        self._test_env.set_config_func(3, self.el1259_config_func)
         self._test_env.setup()
-        self._el1259 = self._test_env.get_slaves()[3]
+        self._test_env.go_to_op_state()
+
+        # the same configuration, but the slaves are in OP and the threads are running
+        self._test_env.setup()
+        self.assertEqual(self._config_func_calls, [3, 3])
+        self.assertEqual(self._test_env.get_master().read_state(), pysoem.SAFEOP_STATE)
 
     def tearDown(self):
         self._test_env.teardown()
 
-    def test_access_not_existing_object(self):
 
-        # read
-        with self.assertRaises(pysoem.SdoError) as ex1:
-            self._el1259.sdo_read(0x1111, 0, 1)
-        self.assertEqual(ex1.exception.abort_code, 0x06020000)
-        self.assertEqual(ex1.exception.desc, 'The object does not exist in the object directory')
+class PySoemTestSdo(unittest.TestCase):
+    """Test SDO communication"""
 
-        # write
-        with self.assertRaises(pysoem.SdoError) as ex2:
-            self._el1259.sdo_write(0x1111, 0, bytes(4))
-        self.assertEqual(ex2.exception.abort_code, 0x06020000)
-        self.assertEqual(ex2.exception.desc, 'The object does not exist in the object directory')
+    @classmethod
+    def setUpClass(cls):
+        # the tests of this class only use mailbox communication, so they can share one setup
+        cls._test_env = PySoemTestEnvironment()
+        cls._test_env.setup()
+        cls._el1259 = cls._test_env.get_slaves()[3]
+        # identity as found during config_init, it does not change while the class runs
+        cls._expected_man = cls._el1259.man
+        cls._expected_id = cls._el1259.id
+        cls._expected_rev = cls._el1259.rev
+        cls._expected_name = cls._el1259.name
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._test_env.teardown()
+
+    def test_access_not_existing_object(self):
+
+        for access, args in [(self._el1259.sdo_read, (0x1111, 0, 1)),
+                             (self._el1259.sdo_write, (0x1111, 0, bytes(4)))]:
+            with self.subTest(access=access.__name__):
+                with self.assertRaises(pysoem.SdoError) as ex:
+                    access(*args)
+                self.assertEqual(ex.exception.abort_code, 0x06020000)
+                self.assertEqual(ex.exception.desc, 'The object does not exist in the object directory')
 
     def test_write_a_ro_object(self):
 
@@ -229,29 +371,27 @@ class PySoemTestSdo(unittest.TestCase):
         
     def test_compare_eeprom_against_coe_0x1018(self):
         
-        sdo_man = struct.unpack('I', self._el1259.sdo_read(0x1018, 1))[0]
-        self.assertEqual(sdo_man, self._el1259.man)
-        sdo_id = struct.unpack('I', self._el1259.sdo_read(0x1018, 2))[0]
-        self.assertEqual(sdo_id, self._el1259.id)
-        sdo_rev = struct.unpack('I', self._el1259.sdo_read(0x1018, 3))[0]
-        self.assertEqual(sdo_rev, self._el1259.rev)
-
-        sdo_sn = struct.unpack('I', self._el1259.sdo_read(0x1018, 4))[0]
+        # read the whole identity object in one go, with complete access subindex 0 comes as 16 bit value
+        entries, sdo_man, sdo_id, sdo_rev, sdo_sn = struct.unpack_from(
+            '<BxIIII', self._el1259.sdo_read(0x1018, 0, ca=True))
+        self.assertEqual(entries, 4)
+        self.assertEqual(sdo_man, self._expected_man)
+        self.assertEqual(sdo_id, self._expected_id)
+        self.assertEqual(sdo_rev, self._expected_rev)
+
         # serial number is expected to be at word address 0x0E
-        eeprom_sn = struct.unpack('I', self._el1259.eeprom_read(0x0E))[0]
+        eeprom_sn, = _U32.unpack(self._el1259.eeprom_read(0x0E))
         self.assertEqual(sdo_sn, eeprom_sn)
 
     def test_device_name(self):
 
-        name_size = len(self._el1259.name)
+        name = self._expected_name
 
-        # test with given string size
-        sdo_name = self._el1259.sdo_read(0x1008, 0, name_size).decode('utf-8')
-        self.assertEqual(sdo_name, self._el1259.name)
-
-        # test without given string size
-        sdo_name = self._el1259.sdo_read(0x1008, 0).decode('utf-8')
-        self.assertEqual(sdo_name, self._el1259.name)
+        # one read with given string size and one without, both must yield the same name
+        sdo_name_sized = self._el1259.sdo_read(0x1008, 0, len(name)).decode('utf-8')
+        sdo_name_unsized = self._el1259.sdo_read(0x1008, 0).decode('utf-8')
+        self.assertEqual(sdo_name_sized, sdo_name_unsized)
+        self.assertEqual(sdo_name_sized, name)
         
     def test_read_buffer_to_small(self):
         
@@ -277,6 +417,8 @@ class PySoemTestSdo(unittest.TestCase):
         """
         master = self._test_env.get_master()
         old_sdo_read_timeout = master.sdo_read_timeout
+        # the master is shared by the whole class, restore the timeout even if an assertion fails
+        self.addCleanup(setattr, master, 'sdo_read_timeout', old_sdo_read_timeout)
         self.assertEqual(old_sdo_read_timeout, 700000)
         master.sdo_read_timeout = 0
         self.assertEqual(master.sdo_read_timeout, 0)
@@ -290,6 +432,8 @@ class PySoemTestSdo(unittest.TestCase):
         """
         master = self._test_env.get_master()
         old_sdo_write_timeout = master.sdo_write_timeout
+        # the master is shared by the whole class, restore the timeout even if an assertion fails
+        self.addCleanup(setattr, master, 'sdo_write_timeout', old_sdo_write_timeout)
         self.assertEqual(old_sdo_write_timeout, 700000)
         master.sdo_write_timeout = 0
         self.assertEqual(master.sdo_write_timeout, 0)
@@ -297,24 +441,58 @@ class PySoemTestSdo(unittest.TestCase):
         self.assertEqual(master.sdo_write_timeout, 700000)
 
 
-def get_obj_from_od(od, index):
-    return next(obj for obj in od if obj.index == index)
+class PySoemTestEeprom(unittest.TestCase):
+    """Test EEPROM read"""
+
+    @classmethod
+    def setUpClass(cls):
+        # reading the EEPROM does not change the slaves, one setup for all tests is enough
+        cls._test_env = PySoemTestEnvironment()
+        cls._test_env.setup()
+        cls._el1259 = cls._test_env.get_slaves()[3]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._test_env.teardown()
+
+    def test_read_bulk_equals_single_reads(self):
+
+        single_reads = b''.join(self._el1259.eeprom_read(i) for i in range(0, 0x40, 2))
+        self.assertEqual(self._el1259.eeprom_read_bulk(0, 0x40), single_reads)
+
+    def test_read_bulk_odd_number_of_words(self):
+
+        self.assertEqual(self._el1259.eeprom_read_bulk(0x0E, 1), self._el1259.eeprom_read(0x0E)[:2])
+        self.assertEqual(self._el1259.eeprom_read_bulk(0x0E, 0), b'')
+
+    def test_read_bulk_invalid_range(self):
+
+        with self.assertRaises(ValueError):
+            self._el1259.eeprom_read_bulk(0, -1)
+        with self.assertRaises(ValueError):
+            self._el1259.eeprom_read_bulk(-1, 2)
+        with self.assertRaises(ValueError):
+            self._el1259.eeprom_read_bulk(0xFFFF, 2)
 
 
 class PySoemTestSdoInfo(unittest.TestCase):
     """Test SDO Info read"""
 
-    def setUp(self):
-        self._test_env = PySoemTestEnvironment()
-        self._test_env.setup()
-        self._el1259 = self._test_env.get_slaves()[3]
+    @classmethod
+    def setUpClass(cls):
+        cls._test_env = PySoemTestEnvironment()
+        cls._test_env.setup()
+        cls._el1259 = cls._test_env.get_slaves()[3]
+        # reading the object list is costly, do it once for all tests and look objects up by index
+        cls._od_by_index = {obj.index: obj for obj in cls._el1259.od}
 
-    def tearDown(self):
-        self._test_env.teardown()
+    @classmethod
+    def tearDownClass(cls):
+        cls._test_env.teardown()
 
     def test_sdo_info_var(self):
 
-        obj_0x1000 = get_obj_from_od(self._el1259.od, 0x1000)
+        obj_0x1000 = self._od_by_index[0x1000]
 
         self.assertEqual('Device type', obj_0x1000.name)
         self.assertEqual(7, obj_0x1000.object_code)
@@ -324,7 +502,7 @@ class PySoemTestSdoInfo(unittest.TestCase):
 
     def test_sdo_info_rec(self):
 
-        obj_0x1018 = get_obj_from_od(self._el1259.od, 0x1018)
+        obj_0x1018 = self._od_by_index[0x1018]
 
         self.assertEqual('Identity', obj_0x1018.name)
         self.assertEqual(9, obj_0x1018.object_code)
@@ -339,6 +517,14 @@ class PySoemTestSdoInfo(unittest.TestCase):
 class PySoemTestPdo(unittest.TestCase):
     """Use the fact that the EL1259's output state can be monitored"""
 
+    # PDO assignment of the EL1259, packed once for a complete access write to 0x1c12 and 0x1c13
+    _RX_MAP_OBJ = (0x1603, 0x1607, 0x160B, 0x160F, 0x1613, 0x1617, 0x161B, 0x161F,
+                   0x1620, 0x1621, 0x1622, 0x1623, 0x1624, 0x1625, 0x1626, 0x1627)
+    _RX_MAP_OBJ_BYTES = struct.pack('<Bx{}H'.format(len(_RX_MAP_OBJ)), len(_RX_MAP_OBJ), *_RX_MAP_OBJ)
+    _TX_MAP_OBJ = (0x1A00, 0x1A01, 0x1A02, 0x1A03, 0x1A04, 0x1A05, 0x1A06, 0x1A07, 0x1A08,
+                   0x1A0C, 0x1A10, 0x1A14, 0x1A18, 0x1A1C, 0x1A20, 0x1A24)
+    _TX_MAP_OBJ_BYTES = struct.pack('<Bx{}H'.format(len(_TX_MAP_OBJ)), len(_TX_MAP_OBJ), *_TX_MAP_OBJ)
+
     def setUp(self):
         self._test_env = PySoemTestEnvironment()
 
@@ -353,17 +539,8 @@ class PySoemTestPdo(unittest.TestCase):
 
         el1259.sdo_write(0x8001, 2, struct.pack('B', 1))
 
-        rx_map_obj = [0x1603, 0x1607, 0x160B, 0x160F, 0x1613, 0x1617, 0x161B, 0x161F,
-                      0x1620, 0x1621, 0x1622, 0x1623, 0x1624, 0x1625, 0x1626, 0x1627]
-        pack_fmt = 'Bx' + ''.join(['H' for _ in range(len(rx_map_obj))])
-        rx_map_obj_bytes = struct.pack(pack_fmt, len(rx_map_obj), *rx_map_obj)
-        el1259.sdo_write(0x1c12, 0, rx_map_obj_bytes, True)
-
-        tx_map_obj = [0x1A00, 0x1A01, 0x1A02, 0x1A03, 0x1A04, 0x1A05, 0x1A06, 0x1A07, 0x1A08,
-                      0x1A0C, 0x1A10, 0x1A14, 0x1A18, 0x1A1C, 0x1A20, 0x1A24]
-        pack_fmt = 'Bx' + ''.join(['H' for _ in range(len(tx_map_obj))])
-        tx_map_obj_bytes = struct.pack(pack_fmt, len(tx_map_obj), *tx_map_obj)
-        el1259.sdo_write(0x1c13, 0, tx_map_obj_bytes, True)
+        el1259.sdo_write(0x1c12, 0, self._RX_MAP_OBJ_BYTES, True)
+        el1259.sdo_write(0x1c13, 0, self._TX_MAP_OBJ_BYTES, True)
 
         el1259.dc_sync(1, 1000000)
 
@@ -375,29 +552,96 @@ class PySoemTestPdo(unittest.TestCase):
 
     def io_toggle(self, overlapping_enable):
         """Toggle every output and see if the "Ouput State" in the input changes accordingly"""
-        self._test_env.el1259_config_func = self.el1259_config_func
+        self._test_env.set_config_func(3, self.el1259_config_func)
         self._test_env.setup(overlapping_enable)
         self._test_env.go_to_op_state()
 
         el1259 = self._test_env.get_slaves()[3]
         output_len = len(el1259.output)
 
-        tmp = bytearray([0 for _ in range(output_len)])
+        tmp = bytearray(output_len)
 
         for i in range(8):
             out_offset = 12*i
             in_offset = 4*i
 
             tmp[out_offset] = 0x02
-            el1259.output = bytes(tmp)
+            el1259.output = tmp
             time.sleep(0.1)
             assert el1259.input[in_offset] & 0x04 == 0x04
 
             tmp[out_offset] = 0x00
-            el1259.output = bytes(tmp)
+            el1259.output = tmp
             time.sleep(0.1)
             assert el1259.input[in_offset] & 0x04 == 0x00
 
+    def test_io_toggle_views(self):
+        """Same as io_toggle, but using the zero-copy process data views"""
+        self._test_env.set_config_func(3, self.el1259_config_func)
+        self._test_env.setup()
+        self._test_env.go_to_op_state()
+
+        el1259 = self._test_env.get_slaves()[3]
+        output_view = el1259.output_view()
+        input_view = el1259.input_view()
+        self.assertEqual(len(output_view), len(el1259.output))
+        self.assertEqual(len(input_view), len(el1259.input))
+        self.assertTrue(input_view.readonly)
+
+        for i in range(8):
+            out_offset = 12*i
+            in_offset = 4*i
+
+            output_view[out_offset] = 0x02
+            time.sleep(0.1)
+            assert input_view[in_offset] & 0x04 == 0x04
+
+            output_view[out_offset] = 0x00
+            time.sleep(0.1)
+            assert input_view[in_offset] & 0x04 == 0x00
+
+    def test_pdo_ring(self):
+        self._test_env.set_config_func(3, self.el1259_config_func)
+        self._test_env.setup()
+
+        master = self._test_env.get_master()
+        slaves = self._test_env.get_slaves()
+        with self.assertRaises(ValueError):
+            pysoem.PdoRing(master, 3)
+
+        ring = pysoem.PdoRing(master, 4)
+        self.assertIsNone(ring.latest_view())
+        # the inputs are exchanged in SAFEOP already, without the process data thread they do not change
+        # between the commit and the comparison
+        master.cycle(10000)
+        ring.commit()
+        first_view = ring.latest_view()
+        self.assertTrue(first_view.readonly)
+        self.assertGreater(len(first_view), 0)
+        # the inputs of the slaves of this layout are byte aligned, so they make up the group input back to back
+        self.assertEqual(bytes(first_view), b''.join(slave.input for slave in slaves))
+        first_snapshot = bytes(first_view)
+
+        self._test_env.go_to_op_state()
+        for _ in range(3):
+            ring.commit()
+        self.assertEqual(ring.head, 4)
+        self.assertEqual(bytes(first_view), first_snapshot)
+
+    def test_slave_states(self):
+        self._test_env.set_config_func(3, self.el1259_config_func)
+        self._test_env.setup()
+        master = self._test_env.get_master()
+        slaves = self._test_env.get_slaves()
+
+        master.read_state()
+        self.assertEqual(master.slave_states, bytes([pysoem.SAFEOP_STATE]) * len(slaves))
+
+        self._test_env.go_to_op_state()
+        master.read_state()
+        self.assertEqual(master.slave_states, bytes(slave.state for slave in slaves))
+        self.assertEqual(master.slave_states, bytes([pysoem.OP_STATE]) * len(slaves))
+
     def tearDown(self):
         self._test_env.teardown()
 
@@ -0,0 +1,73 @@
+"""Training run for a profile guided (PGO) build of pysoem.
+
+Usage: python pgo_train.py <adapter> [seconds]
+
+1. build pysoem with the environment variable PYSOEM_PGO=generate
+2. run this script against a network with at least one slave
+3. rebuild pysoem with PYSOEM_PGO=use
+
+This drives the process data cycle, which is the hot path of most
+applications, so that the profile reflects it.
+"""
+
+import sys
+import time
+
+import pysoem
+
+
+def train(ifname, duration):
+    master = pysoem.Master()
+
+    master.open(ifname)
+
+    try:
+        if not master.config_init() > 0:
+            raise Exception('no slave found')
+
+        master.config_map()
+
+        if master.state_check(pysoem.SAFEOP_STATE, 50000) != pysoem.SAFEOP_STATE:
+            raise Exception('not all slaves reached SAFEOP state')
+
+        master.state = pysoem.OP_STATE
+        master.write_state()
+
+        # the slaves only go to OP while process data is exchanged, so keep cycling until they got there
+        for _ in range(40):
+            master.cycle(2000)
+            if master.state_check(pysoem.OP_STATE, 50000) == pysoem.OP_STATE:
+                break
+        else:
+            raise Exception('not all slaves reached OP state')
+
+        # the loop only runs cycle(), like the process data threads of the examples, so the profile is not
+        # diluted by state checks
+        cycle_count = 0
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            master.cycle(2000)
+            cycle_count += 1
+            time.sleep(0.001)
+
+        print('{} cycles done'.format(cycle_count))
+
+        master.state = pysoem.INIT_STATE
+        master.write_state()
+    finally:
+        master.close()
+
+
+if __name__ == '__main__':
+
+    print('pgo_train started')
+
+    if len(sys.argv) > 1:
+        try:
+            train(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 60.0)
+        except Exception as expt:
+            print(expt)
+            sys.exit(1)
+    else:
+        print('usage: pgo_train ifname [seconds]')
+        sys.exit(1)